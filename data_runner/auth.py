@@ -5,13 +5,15 @@ from pathlib import Path
 import msal
 import atexit
 import time
-import json
 from data_runner._base import ENV
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Minimum seconds between token cache writes
+CACHE_FLUSH_INTERVAL = 5.0
+
 
 class MOTOAuth2Client(ENV):
     """
@@ -35,6 +37,8 @@ class MOTOAuth2Client(ENV):
         self.api_key = os.getenv("MOT_API_KEY")
         self.dir = Path(__file__).parent
         self.cache_file = Path(os.path.join(self.dir, cache_file))
+        self._cached_token: Optional[str] = None
+        self._cached_exp: float = 0.0
 
         # Validate required environment variables
         if not all([self.client_id, self.client_secret, self.token_url]):
@@ -69,14 +73,9 @@ class MOTOAuth2Client(ENV):
             except Exception as e:
                 logger.warning(f"Failed to load cache file: {e}")
 
-        # Hint: The following optional line persists only when state changed
-        atexit.register(
-            lambda: (
-                open("my_cache.bin", "w").write(self.cache.serialize())
-                if self.cache.has_state_changed
-                else None
-            )
-        )
+        # Flush whatever the debounce in _save_cache held back
+        self._last_flush = 0.0
+        atexit.register(self._flush_cache_if_dirty)
 
     def _create_msal_app(self) -> msal.ConfidentialClientApplication:
         """Create and configure the MSAL application with token cache."""
@@ -91,48 +90,31 @@ class MOTOAuth2Client(ENV):
 
         return app
 
-    def _save_cache(self) -> None:
-        """Save the token cache to file."""
-        if self.app.token_cache.has_state_changed:
-            try:
-                with open(self.cache_file, "w+") as f:
-                    f.write(self.app.token_cache.serialize())
-                logger.info(f"Token cache saved to {self.cache_file}")
-            except Exception as e:
-                logger.error(f"Failed to save cache: {e}")
-
-    def _is_token_expired(self) -> bool:
-        """
-        Check if the cached token is expired by examining the cache file.
-
-        Returns:
-            True if token is expired or doesn't exist, False otherwise
-        """
+    def _flush_cache_if_dirty(self) -> None:
+        """Atomically write the token cache to file if it changed since the last write."""
+        if not self.cache.has_state_changed:
+            return
+        tmp_file = self.cache_file.with_name(f"{self.cache_file.name}.tmp")
         try:
-            if not self.cache_file.exists():
-                return True
-
-            with open(self.cache_file, "r") as f:
-                cache_data = json.load(f)
-
-            # Look for AccessToken in cache
-            access_tokens = cache_data.get("AccessToken", {})
-            if not access_tokens:
-                return True
-
-            # Check expiry of the first (and likely only) token
-            for token_key, token_data in access_tokens.items():
-                expires_on = token_data.get("expires_on")
-                if expires_on:
-                    current_time = int(time.time())
-                    # Add 60 second buffer to avoid edge cases
-                    return current_time >= (int(expires_on) - 60)
+            with open(tmp_file, "w") as f:
+                f.write(self.cache.serialize())
+            os.replace(tmp_file, self.cache_file)
+            self._last_flush = time.time()
+            logger.info(f"Token cache saved to {self.cache_file}")
+        except Exception as e:
+            logger.error(f"Failed to save cache: {e}")
 
-            return True  # Default to expired if we can't determine
+    def _save_cache(self) -> None:
+        """Save the token cache to file, at most once every CACHE_FLUSH_INTERVAL seconds."""
+        # has_state_changed stays set until serialize(), so skipped writes are retried
+        if time.time() - self._last_flush >= CACHE_FLUSH_INTERVAL:
+            self._flush_cache_if_dirty()
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            logger.warning(f"Error checking token expiry: {e}")
-            return True  # Default to expired if we can't read the cac
+    def _remember_token(self, result: Dict[str, Any]) -> str:
+        """Keep an acquired token in memory until shortly before it expires."""
+        self._cached_token = result["access_token"]
+        self._cached_exp = time.time() + int(result.get("expires_in", 0))
+        return self._cached_token
 
     def get_access_token(self, force_refresh: bool = False) -> Optional[str]:
         """
@@ -144,6 +126,14 @@ class MOTOAuth2Client(ENV):
         Returns:
             Access token string or None if authentication fails
         """
+        # Serve the in-memory token with a 60 second buffer to avoid edge cases
+        if (
+            not force_refresh
+            and self._cached_token
+            and time.time() < self._cached_exp - 60
+        ):
+            return self._cached_token
+
         scopes = [self.scope_url]
 
         # Try to get token from cache first (unless force refresh is requested)
@@ -154,7 +144,7 @@ class MOTOAuth2Client(ENV):
                     result = self.app.acquire_token_silent(scopes, account=accounts[0])
                     if result and "access_token" in result:
                         logger.info("Access token acquired from cache")
-                        return result["access_token"]
+                        return self._remember_token(result)
                     elif result and "error" in result:
                         logger.warning(
                             f"Silent token acquisition failed: {result['error']}"
@@ -168,7 +158,7 @@ class MOTOAuth2Client(ENV):
 
             if "access_token" in result:
                 self._save_cache()
-                return result["access_token"]
+                return self._remember_token(result)
             else:
                 error_msg = result.get("error", "Unknown error")
                 error_desc = result.get("error_description", "No description")
@@ -208,6 +198,8 @@ class MOTOAuth2Client(ENV):
                 logger.info("Token cache cleared")
 
             # Clear in-memory cache
+            self._cached_token = None
+            self._cached_exp = 0.0
             accounts = self.app.get_accounts()
             for account in accounts:
                 self.app.remove_account(account)
@@ -1,38 +1,91 @@
 #!/usr/bin/env python3
 """
-Extract all .json.gz files from each date folder in /data and merge them into a single JSON file per folder.
-Then combine all data into a single CSV file with a date field.
+Extract all .json.gz files from each date folder in /data and recompress each into a gzipped NDJSON part file,
+adding a date field to every record.
 """
 
 import os
-import csv
 import gzip
-import json
+import multiprocessing
 import re
 import shutil
 import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 from tqdm import tqdm
 from data_runner._base import DATA_DIR
 
-CSV_FIELDNAMES = [
-    "date",
-    "registration",
-    "make",
-    "model",
-    "primaryColour",
-    "secondaryColour",
-    "fuelType",
-    "engineSize",
-    "manufactureDate",
-    "registrationDate",
-    "firstUsedDate",
-    "lastMotTestDate",
-    "modification",
-    "motTestCount",
-    "motTests",
-]
+
+# Compressed bytes read per syscall when streaming a .json.gz
+READ_BLOCK_SIZE = 4 * 1024 * 1024
+# Output compression favours speed; the upload is bandwidth-bound either way
+GZIP_LEVEL = 1
+_DATE_RE = re.compile(r"(\d{2}-\d{2}-\d{4})$")
+
+
+def _iter_gz_lines(gz_file: Path):
+    """Yield the lines of a gzip file in batches, decompressing in large blocks."""
+    dec = zlib.decompressobj(wbits=31)
+    tail = b""
+    empty = True
+    with open(gz_file, "rb") as raw:
+        while chunk := raw.read(READ_BLOCK_SIZE):
+            empty = False
+            data = dec.decompress(chunk)
+            # Start a fresh decoder for each concatenated gzip member; like gzip,
+            # skip zero padding between members and ignore it at the end
+            while dec.eof and dec.unused_data:
+                chunk = dec.unused_data.lstrip(b"\x00")
+                if not chunk:
+                    break
+                dec = zlib.decompressobj(wbits=31)
+                data += dec.decompress(chunk)
+            lines = (tail + data).split(b"\n")
+            tail = lines.pop()
+            yield lines
+    if empty:
+        return  # like gzip, a zero-byte file has no lines
+    if not dec.eof:
+        raise EOFError(
+            "Compressed file ended before the end-of-stream marker was reached"
+        )
+    tail += dec.flush()
+    if tail:
+        yield [tail]
+
+
+def _splice_gz_file(gz_file: Path, part_file: Path, date_suffix: bytes) -> int:
+    """Recompress one .json.gz into part_file, appending the date field to every record."""
+    record_count = 0
+    with gzip.open(part_file, "wb", compresslevel=GZIP_LEVEL) as out:
+        for lines in _iter_gz_lines(gz_file):
+            # Collect the block's output and hand it to the compressor in one write
+            batch = []
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                end = line.rfind(b"}")
+                if end == -1:
+                    raise ValueError(f"not a JSON object: {line[:80]!r}")
+                head = line[:end].rstrip()
+                batch.append(head)
+                # `{}` has no members to separate from the date
+                batch.append(date_suffix[1:] if head == b"{" else date_suffix)
+                record_count += 1
+            out.write(b"".join(batch))
+    return record_count
+
+
+def _has_records(part_file: Path) -> bool:
+    """Whether a part file holds at least one complete record."""
+    try:
+        with gzip.open(part_file, "rb") as f:
+            return f.readline().endswith(b"\n")
+    except (OSError, EOFError):
+        return False
 
 
 class DataProcessor:
@@ -44,7 +97,7 @@ class DataProcessor:
     @staticmethod
     def extract_date_from_folder(folder_name: str) -> str:
         """Extract date from folder name and subtract one day (download date refers to previous day's data)."""
-        match = re.search(r"(\d{2}-\d{2}-\d{4})$", folder_name)
+        match = _DATE_RE.search(folder_name)
         if not match:
             return ""
         date_str = match.group(1)
@@ -54,24 +107,45 @@ class DataProcessor:
 
     def process_folder(
         self, folder_path: Path, delete_originals: bool = False
-    ) -> Path | None:
-        """Process a single date folder - merge all .json.gz files into one NDJSON file in data_dir."""
-        gz_files = sorted(folder_path.glob("*.json.gz"))
+    ) -> list[Path]:
+        """
+        Process a single date folder into gzipped NDJSON part files in data_dir.
+
+        Each source .json.gz becomes its own `{folder}.{i:04d}.json.gz` part, so
+        BigQuery can read the parts in parallel and no single file approaches its
+        4 GB compressed-file limit.
+
+        Returns:
+            The non-empty part files in source order, or [] if nothing was produced.
+        """
+        with os.scandir(folder_path) as it:
+            gz_files = sorted(
+                Path(e.path) for e in it if e.name.endswith(".json.gz") and e.is_file()
+            )
         date_str = self.extract_date_from_folder(folder_path.name)
-        output_file = self.data_dir / f"{folder_path.name}.json"
 
         if not gz_files:
             # Check if already processed
-            if output_file.exists():
-                print(f"  Already processed: {output_file.name}")
-                return output_file
+            existing = sorted(self.data_dir.glob(f"{folder_path.name}.*.json.gz"))
+            if existing:
+                print(f"  Already processed: {folder_path.name} ({len(existing)} parts)")
+                return existing
             print(f"  No .json.gz files found in {folder_path.name}")
-            return None
+            return []
 
+        # Records are spliced as raw bytes rather than decoded and re-encoded
+        date_suffix = f',"date":"{date_str}"}}\n'.encode()
+        part_files = [
+            self.data_dir / f"{folder_path.name}.{i:04d}.json.gz"
+            for i in range(len(gz_files))
+        ]
+        part_counts = {}
         total_size = sum(gz.stat().st_size for gz in gz_files)
-        record_count = 0
+        workers = min(len(gz_files), os.cpu_count() or 1)
+        # Callers may be running download threads, which fork cannot copy safely
+        mp_context = multiprocessing.get_context("forkserver")
         with (
-            open(output_file, "w", encoding="utf-8") as out,
+            ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool,
             tqdm(
                 total=total_size,
                 unit="B",
@@ -79,22 +153,38 @@ class DataProcessor:
                 desc=f"  {folder_path.name}",
             ) as pbar,
         ):
-            for gz_file in gz_files:
-                file_size = gz_file.stat().st_size
+            futures = {
+                pool.submit(_splice_gz_file, gz_file, part_file, date_suffix): (
+                    gz_file,
+                    part_file,
+                )
+                for gz_file, part_file in zip(gz_files, part_files)
+            }
+            for future in as_completed(futures):
+                gz_file, part_file = futures[future]
                 try:
-                    with gzip.open(gz_file, "rt", encoding="utf-8") as f:
-                        for line in f:
-                            line = line.strip()
-                            if line:
-                                record = json.loads(line)
-                                record["date"] = date_str
-                                out.write(json.dumps(record) + "\n")
-                                record_count += 1
+                    part_counts[part_file] = future.result()
                 except Exception as e:
+                    part_counts[part_file] = None  # count unknown
                     print(f"  Error reading {gz_file.name}: {e}")
-                pbar.update(file_size)
+                pbar.update(gz_file.stat().st_size)
 
-        print(f"  {record_count} records -> {output_file.name}")
+        # Drop parts with no records; a part cut short by an error keeps what was read
+        output_files = []
+        for part_file in part_files:
+            count = part_counts[part_file]
+            if count is None:
+                # The worker failed, so check what actually reached the part
+                keep = part_file.exists() and _has_records(part_file)
+            else:
+                keep = count > 0
+            if keep:
+                output_files.append(part_file)
+            else:
+                part_file.unlink(missing_ok=True)
+
+        record_count = sum(n for n in part_counts.values() if n)
+        print(f"  {record_count} records -> {len(output_files)} parts")
 
         # Delete original .gz files if requested
         if delete_originals:
@@ -102,64 +192,61 @@ class DataProcessor:
                 gz_file.unlink()
             print(f"  Deleted {len(gz_files)} original .gz files")
 
-        return output_file
+        return output_files
 
-    @staticmethod
-    def flatten_record_for_csv(record: dict) -> dict:
-        """Flatten a vehicle record for CSV output."""
-        return {
-            "date": record.get("date", ""),
-            "registration": record.get("registration", ""),
-            "make": record.get("make", ""),
-            "model": record.get("model", ""),
-            "primaryColour": record.get("primaryColour", ""),
-            "secondaryColour": record.get("secondaryColour", ""),
-            "fuelType": record.get("fuelType", ""),
-            "engineSize": record.get("engineSize", ""),
-            "manufactureDate": record.get("manufactureDate", ""),
-            "registrationDate": record.get("registrationDate", ""),
-            "firstUsedDate": record.get("firstUsedDate", ""),
-            "lastMotTestDate": record.get("lastMotTestDate", ""),
-            "modification": record.get("modification", ""),
-            "motTestCount": len(record.get("motTests", [])),
-            "motTests": json.dumps(record.get("motTests", [])),
-        }
-
-    def write_csv(self, records: list[dict], output_path: Path) -> None:
-        """Write all records to a single CSV file."""
-        if not records:
-            print("No records to write to CSV")
-            return
-
-        with open(output_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
-            writer.writeheader()
-            for record in records:
-                writer.writerow(self.flatten_record_for_csv(record))
-
-        print(f"CSV written to: {output_path}")
+    def unzip(self, zf: Path) -> Path:
+        """Extract a single .zip into a folder in data_dir, then remove the zip."""
+        dest = self.data_dir / zf.stem  # e.g. delta-light-vehicle_02-02-2026
+        if dest.exists():
+            print(f"  Skipping {zf.name} (already extracted)")
+            return dest
+        print(f"  Extracting {zf.name} …")
+        with zipfile.ZipFile(zf, "r") as z:
+            # Members are flattened into dest, which also keeps them inside it;
+            # check names first so a clash leaves no half-extracted folder behind
+            members = {}
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                name = Path(info.filename).name
+                if name in members:
+                    raise ValueError(f"{zf.name} has more than one member named {name}")
+                members[name] = info
+            dest.mkdir()
+            for name, info in members.items():
+                # Stream each member straight to disk in large blocks
+                with z.open(info) as src, open(dest / name, "wb") as out:
+                    shutil.copyfileobj(src, out, READ_BLOCK_SIZE)
+        zf.unlink()
+        print(f"  Extracted to {dest.name}, zip removed")
+        return dest
 
     def unzip_all(self) -> list[Path]:
         """Extract all .zip files in data_dir into folders, then remove the zips."""
-        zip_files = sorted(self.data_dir.glob("*.zip"))
-        folders = []
-        for zf in zip_files:
-            dest = self.data_dir / zf.stem  # e.g. delta-light-vehicle_02-02-2026
-            if dest.exists():
-                print(f"  Skipping {zf.name} (already extracted)")
-                folders.append(dest)
-                continue
-            print(f"  Extracting {zf.name} …")
-            dest.mkdir()
-            with zipfile.ZipFile(zf, "r") as z:
-                z.extractall(dest)
-            zf.unlink()
-            print(f"  Extracted to {dest.name}, zip removed")
-            folders.append(dest)
-        return folders
+        return [self.unzip(zf) for zf in sorted(self.data_dir.glob("*.zip"))]
+
+    def _process_and_remove(self, folder: Path) -> list[Path]:
+        print(f"Processing: {folder.name}")
+        result = self.process_folder(folder, delete_originals=True)
+        shutil.rmtree(folder)
+        print(f"  Removed folder: {folder.name}")
+        print()
+        return result
+
+    def process_download(self, zf: Path) -> list[Path]:
+        """
+        Unzip and process a single downloaded archive.
+
+        Lets callers process each file as soon as it lands instead of waiting
+        for every download to finish before calling run().
+
+        Returns:
+            Paths to the gzipped NDJSON part files, empty if nothing was produced.
+        """
+        return self._process_and_remove(self.unzip(zf))
 
     def run(self) -> list[Path]:
-        """Unzip downloads, process all date folders and return paths to output NDJSON files."""
+        """Unzip downloads, process all date folders and return paths to output gzipped NDJSON parts."""
         if not self.data_dir.exists():
             print(f"Error: {self.data_dir} does not exist")
             return []
@@ -168,30 +255,23 @@ class DataProcessor:
         self.unzip_all()
 
         # Find all date folders
-        folders = [
-            f
-            for f in self.data_dir.iterdir()
-            if f.is_dir()
-            and (
-                f.name.startswith("delta-light-vehicle")
-                or f.name.startswith("bulk-light-vehicle")
-            )
-        ]
+        # DirEntry.is_dir() reuses the d_type from the directory listing
+        with os.scandir(self.data_dir) as it:
+            folders = [
+                Path(e.path)
+                for e in it
+                if e.name.startswith(("delta-light-vehicle", "bulk-light-vehicle"))
+                and e.is_dir()
+            ]
         folders.sort()
 
         print(f"Found {len(folders)} folders to process\n")
 
         output_files = []
         for folder in folders:
-            print(f"Processing: {folder.name}")
-            result = self.process_folder(folder, delete_originals=True)
-            if result:
-                output_files.append(result)
-            shutil.rmtree(folder)
-            print(f"  Removed folder: {folder.name}")
-            print()
-
-        print(f"Produced {len(output_files)} NDJSON files in {self.data_dir}")
+            output_files.extend(self._process_and_remove(folder))
+
+        print(f"Produced {len(output_files)} NDJSON parts in {self.data_dir}")
         return output_files
 
 
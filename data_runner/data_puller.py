@@ -1,7 +1,11 @@
 import logging
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Callable
 
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from data_runner.auth import MOTOAuth2Client
 from data_runner._base import DATA_DIR
@@ -10,6 +14,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BULK_DOWNLOAD_URL = "https://history.mot.api.gov.uk/v1/trade/vehicles/bulk-download"
+DOWNLOAD_WORKERS = 8
 
 
 class DataPuller:
@@ -20,6 +25,12 @@ class DataPuller:
         self.data_dir = Path(__file__).parent / DATA_DIR
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
+        # Shared session so parallel downloads reuse pooled connections
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
     def pull(self) -> dict:
         """
         Authenticate and pull the bulk-download manifest.
@@ -35,48 +46,89 @@ class DataPuller:
             raise RuntimeError("Failed to obtain auth headers – check credentials")
 
         logger.info("Requesting bulk download from %s", BULK_DOWNLOAD_URL)
-        response = requests.get(BULK_DOWNLOAD_URL, headers=headers)
+        response = self._session.get(BULK_DOWNLOAD_URL, headers=headers)
         response.raise_for_status()
 
         data = response.json()
         logger.info("Bulk download response received (%d top-level keys)", len(data))
         return data
 
-    def _download_file(self, url: str, dest: Path, total_size: int = 0) -> None:
-        resp = requests.get(url, stream=True, timeout=120)
+    def _download_file(
+        self, url: str, dest: Path, total_size: int = 0, position: int | None = None
+    ) -> None:
+        resp = self._session.get(url, stream=True, timeout=120)
         resp.raise_for_status()
+        resp.raw.decode_content = True
         total = int(resp.headers.get("content-length", total_size))
         with (
             open(dest, "wb") as f,
-            tqdm(total=total, unit="B", unit_scale=True, desc=f"  {dest.name}") as pbar,
+            tqdm.wrapattr(
+                f,
+                "write",
+                total=total,
+                unit="B",
+                unit_scale=True,
+                desc=f"  {dest.name}",
+                position=position,
+            ) as out,
         ):
-            for chunk in resp.iter_content(chunk_size=1024 * 512):
-                f.write(chunk)  #
-                pbar.update(len(chunk))
-
-    def _download_entries(self, entries: list[dict], label: str) -> list[Path]:
+            shutil.copyfileobj(resp.raw, out, length=1024 * 1024)
+
+    def _download_entries(
+        self,
+        entries: list[dict],
+        label: str,
+        on_download: Callable[[Path], None] | None = None,
+    ) -> list[Path]:
         downloaded = []
-        i = 0
-        while i < len(entries):
-            entry = entries[i]
+        pending = []
+        for entry in entries:
             filename = Path(entry["filename"]).name
             dest = self.data_dir / filename
             if dest.exists():
                 logger.info("Skipping %s (already exists)", filename)
                 downloaded.append(dest)
-                i += 1
+                if on_download:
+                    on_download(dest)
                 continue
-            try:
-                self._download_file(entry["downloadUrl"], dest, entry.get("fileSize", 0))
-            except requests.exceptions.HTTPError as exc:
-                if exc.response is not None and exc.response.status_code == 403:
-                    logger.warning("Presigned URL expired for %s, refreshing manifest", filename)
-                    entries = self.pull().get(label, [])
-                    continue
-                raise
-            logger.info("Saved %s", dest)
-            downloaded.append(dest)
-            i += 1
+            pending.append(entry)
+
+        while pending:
+            expired = set()
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                futures = {}
+                for i, entry in enumerate(pending):
+                    dest = self.data_dir / Path(entry["filename"]).name
+                    future = executor.submit(
+                        self._download_file,
+                        entry["downloadUrl"],
+                        dest,
+                        entry.get("fileSize", 0),
+                        position=i % DOWNLOAD_WORKERS,
+                    )
+                    futures[future] = (entry, dest)
+                for future in as_completed(futures):
+                    entry, dest = futures[future]
+                    try:
+                        future.result()
+                    except requests.exceptions.HTTPError as exc:
+                        if exc.response is not None and exc.response.status_code == 403:
+                            expired.add(entry["filename"])
+                            continue
+                        raise
+                    logger.info("Saved %s", dest)
+                    downloaded.append(dest)
+                    if on_download:
+                        on_download(dest)
+
+            pending = []
+            if expired:
+                logger.warning(
+                    "Presigned URLs expired for %d files, refreshing manifest", len(expired)
+                )
+                entries = self.pull().get(label, [])
+                pending = [e for e in entries if e["filename"] in expired]
+
         logger.info("Downloaded %d / %d %s files", len(downloaded), len(entries), label)
         return downloaded
 
@@ -119,10 +171,16 @@ class DataPuller:
             return []
         return self._download_entries(bulk_files, "bulk")
 
-    def download_deltas(self) -> list[Path]:
+    def download_deltas(
+        self, on_download: Callable[[Path], None] | None = None
+    ) -> list[Path]:
         """
         Pull the manifest then download every delta file into the data folder.
 
+        Args:
+            on_download: Called with each file's path as soon as it is on disk,
+                so processing can overlap the remaining downloads
+
         Returns:
             List of paths to the downloaded files.
         """
@@ -131,7 +189,7 @@ class DataPuller:
         if not deltas:
             logger.info("No delta files available")
             return []
-        return self._download_entries(deltas, "delta")
+        return self._download_entries(deltas, "delta", on_download)
 
 
 if __name__ == "__main__":
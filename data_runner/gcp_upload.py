@@ -1,144 +1,788 @@
 import base64
+import functools
 import io
+import itertools
 import json
 import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from google.cloud import bigquery
+import orjson
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery, storage
+from google.cloud.storage import transfer_manager
+from google.cloud.storage.retry import DEFAULT_RETRY
 from google.oauth2 import service_account
 from tqdm import tqdm
 from data_runner._base import ENV
+from data_runner.data_processor import GZIP_LEVEL, READ_BLOCK_SIZE, _iter_gz_lines
+
+GCS_CHUNK_SIZE = 8 * 1024 * 1024  # resumable upload chunk, must be a multiple of 256 KiB
+GCS_UPLOAD_WORKERS = 8  # files uploaded at once
+# Concurrent per-part load jobs into the scratch table when there is no staging bucket
+LOAD_JOB_WORKERS = 8
+# Main-table columns computed by merge_delta.sql rather than present in delta files
+DERIVED_COLUMNS = frozenset(
+    {"last_test_date", "last_test_result", "mileage", "vehicle_age", "pass_count", "fail_count"}
+)
+# Main-table columns merge_delta.sql writes from staging; keep in step with its
+# UPDATE SET and INSERT lists
+MERGED_COLUMNS = DERIVED_COLUMNS | {
+    "registration", "modification", "motTests", "engineSize", "make", "model",
+    "lastMotTestDate", "manufactureDate", "primaryColour", "registrationDate",
+    "fuelType", "secondaryColour", "firstUsedDate",
+}
+SQL_DIR = Path(__file__).parent
+# Staged rows as a fraction of main above which main is rewritten instead of MERGEd
+REBUILD_RATIO = 0.2
+PARTITION_FIELD = "lastMotTestDate"
+
+
+@functools.lru_cache(maxsize=None)
+def _make_credentials(raw_creds: str) -> service_account.Credentials:
+    """Parse service account credentials from raw or base64-encoded JSON."""
+    try:
+        creds_json = json.loads(raw_creds)
+    except json.JSONDecodeError:
+        creds_json = json.loads(base64.b64decode(raw_creds))
+    return service_account.Credentials.from_service_account_info(creds_json)
+
+
+# Clients are shared across GCPUploader instances so each process builds them once
+@functools.lru_cache(maxsize=None)
+def _make_client(project_id: str, raw_creds: str) -> bigquery.Client:
+    return bigquery.Client(credentials=_make_credentials(raw_creds), project=project_id)
+
+
+@functools.lru_cache(maxsize=None)
+def _make_storage_client(project_id: str, raw_creds: str) -> storage.Client:
+    return storage.Client(credentials=_make_credentials(raw_creds), project=project_id)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_sql(name: str) -> str:
+    with open(SQL_DIR / name, "r") as f:
+        return f.read()
+
+
+def _day_partitioning(field: str) -> bigquery.TimePartitioning:
+    return bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=field)
+
+
+@functools.lru_cache(maxsize=8)
+def _make_job_config(
+    write_disposition,
+    partition_field=None,
+    clustering_fields=None,
+    schema=None,
+    drop_unknown=False,
+) -> bigquery.LoadJobConfig:
+    """
+    Build the load job config for one combination of options.
+
+    Configs are shared between calls, so arguments must be hashable (tuples for
+    clustering_fields and schema) and callers must not modify the result.
+    With a pinned `schema`, fields it lacks fail the load unless `drop_unknown`.
+    """
+    # BigQuery detects gzip from the payload, so .json.gz files are sent as-is
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=write_disposition,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        autodetect=True,
+        max_bad_records=0,  # a value that does not fit its column fails the load
+    )
+    if schema is not None:
+        # A pinned schema skips the sampling pass
+        job_config.schema = list(schema)
+        job_config.autodetect = False
+        job_config.ignore_unknown_values = drop_unknown
+    if partition_field:
+        job_config.time_partitioning = _day_partitioning(partition_field)
+    if clustering_fields:
+        job_config.clustering_fields = list(clustering_fields)
+    return job_config
+
+
+def _field_paths(fields, prefix=""):
+    """Dotted names of `fields` and of every field nested below them."""
+    paths = set()
+    for f in fields:
+        paths.add(prefix + f.name)
+        paths |= _field_paths(f.fields, f"{prefix}{f.name}.")
+    return paths
+
+
+def _collect_keys(value, keys, prefix=""):
+    """Add the dotted key paths of a decoded record, through nested lists, to `keys`."""
+    if isinstance(value, list):
+        for item in value:
+            _collect_keys(item, keys, prefix)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            keys.add(prefix + k)
+            _collect_keys(v, keys, f"{prefix}{k}.")
+
+
+def _numbered_lines(file_path):
+    """Yield (line number, line) for a gzipped file, without line endings."""
+    return enumerate(itertools.chain.from_iterable(_iter_gz_lines(file_path)))
+
+
+def _record_shape(record):
+    """Hashable signature of a record's top-level keys and its motTests' key sets."""
+    tests = record.get("motTests")
+    if not isinstance(tests, list):
+        tests = ()
+    return frozenset(record), frozenset(
+        frozenset(t) for t in tests if isinstance(t, dict)
+    )
+
+
+def iter_delta_lines(file_path, keep=None):
+    """Yield the NDJSON lines of a gzipped file, only those numbered in `keep` if given."""
+    for n, line in _numbered_lines(file_path):
+        if keep is None or n in keep:
+            yield line + b"\n"
+
+
+class IterReader(io.RawIOBase):
+    """Read-only stream over an iterable of byte chunks, such as NDJSON lines."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = memoryview(b"")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, b) -> int:
+        n = 0
+        while n < len(b):
+            if not self._buf:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buf = memoryview(chunk)
+            k = min(len(b) - n, len(self._buf))
+            b[n : n + k] = self._buf[:k]
+            self._buf = self._buf[k:]
+            n += k
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+        super().close()
+
+
+class GzipReader(io.RawIOBase):
+    """Read-only stream yielding the gzip-compressed bytes of `raw` as it is consumed."""
+
+    def __init__(self, raw, level: int = GZIP_LEVEL):
+        self._raw = raw
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self._buf = memoryview(b"")
+        self._eof = False
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, b) -> int:
+        while not self._buf and not self._eof:
+            chunk = self._raw.read(READ_BLOCK_SIZE)
+            if chunk:
+                self._buf = memoryview(self._compressor.compress(chunk))
+            else:
+                self._buf = memoryview(self._compressor.flush())
+                self._eof = True
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        self._raw.close()
+        super().close()
 
 
 class GCPUploader(ENV):
-    def __init__(self, dataset_id, main_table_id):
+    def __init__(
+        self, dataset_id, main_table_id, quiet=None, rebuild_ratio=REBUILD_RATIO
+    ):
         ENV.__init__(self)
 
         self.project_id = os.environ.get("GCP_PROJECT")
         raw = os.environ["GCP_SERVICE_CREDS"]
-        try:
-            creds_json = json.loads(raw)
-        except json.JSONDecodeError:
-            creds_json = json.loads(base64.b64decode(raw))
-        self.credentials = service_account.Credentials.from_service_account_info(
-            creds_json
-        )
+        self.credentials = _make_credentials(raw)
         self.dataset_id = dataset_id
         self.table_id = main_table_id
 
         self.main_table_ref = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
         self.staging_table_ref = f"{self.main_table_ref}_staging"  # for deltas
-        self.client = bigquery.Client(
-            credentials=self.credentials, project=self.project_id
-        )
+        self.client = _make_client(self.project_id, raw)
+        self._schemas = {}  # table_ref -> schema, dropped when a load may change it
+        self._clustered = set()  # table_refs whose clustering has been checked
+        # Upload progress bars only help when someone is watching a terminal
+        self.quiet = not sys.stderr.isatty() if quiet is None else quiet
+        self.rebuild_ratio = rebuild_ratio
 
-        merge_template_path = Path(__file__).parent / "merge_delta.sql"
-        with open(merge_template_path, "r") as f:
-            self.merge_template = f.read()
+        # Optional bucket to stage files in, so BigQuery loads them server-side
+        self.gcs_bucket = os.environ.get("GCP_STAGING_BUCKET")
+        self.storage_client = (
+            _make_storage_client(self.project_id, raw) if self.gcs_bucket else None
+        )
 
-        self.merge_template = self.merge_template.replace(
+        self.merge_template = _read_sql("merge_delta.sql").replace(
             "!!main!!", self.main_table_ref
         )
         self.merge_template = self.merge_template.replace(
             "!!staging!!", self.staging_table_ref
         )
+        self.rebuild_template = _read_sql("rebuild_delta.sql").replace(
+            "!!main!!", self.main_table_ref
+        )
+        self.rebuild_template = self.rebuild_template.replace(
+            "!!staging!!", self.staging_table_ref
+        )
 
-    def _load_to_table(
+    def _progress(self, f, total=None, quiet=None):
+        """Wrap a readable file in a progress bar unless running quietly."""
+        if self.quiet if quiet is None else quiet:
+            return f
+        return tqdm.wrapattr(f, "read", total=total, unit="B", unit_scale=True)
+
+    def _upload_to_gcs(self, file_paths) -> str:
+        """
+        Upload local files in parallel to one prefix in the staging bucket.
+
+        Returns:
+            The prefix, under which the objects are named after the files.
+        """
+        file_paths = [Path(fp) for fp in file_paths]
+        prefix = f"staging/{file_paths[0].name.split('.', 1)[0]}/"
+        bucket = self.storage_client.bucket(self.gcs_bucket)
+        # Leftovers from an interrupted run would match the load's wildcard
+        self._delete_from_gcs(prefix)
+        source_dir = os.path.commonpath([fp.parent for fp in file_paths])
+        print(
+            f"Uploading {len(file_paths)} files to gs://{self.gcs_bucket}/{prefix}..."
+        )
+        transfer_manager.upload_many_from_filenames(
+            bucket,
+            [str(fp.relative_to(source_dir)) for fp in file_paths],
+            source_directory=source_dir,
+            blob_name_prefix=prefix,
+            blob_constructor_kwargs={"chunk_size": GCS_CHUNK_SIZE},
+            upload_kwargs={"timeout": 600, "retry": DEFAULT_RETRY},
+            raise_exception=True,
+            max_workers=GCS_UPLOAD_WORKERS,
+            worker_type=transfer_manager.THREAD,
+        )
+        return prefix
+
+    def _delete_from_gcs(self, prefix):
+        """Delete every object under `prefix` in the staging bucket."""
+        for blob in self.storage_client.list_blobs(self.gcs_bucket, prefix=prefix):
+            blob.delete()
+
+    def _load_file(self, file_path, table_ref, job_config, quiet=None) -> int:
+        """Upload one local file into a load job and wait for it."""
+        size = os.path.getsize(file_path)
+        with self._progress(
+            open(file_path, "rb", buffering=READ_BLOCK_SIZE), total=size, quiet=quiet
+        ) as f:
+            # A known size lets the client pick the upload protocol up front
+            job = self.client.load_table_from_file(
+                f, table_ref, size=size, job_config=job_config
+            )
+        job.result()
+        return job.output_rows
+
+    def _load_via_gcs(self, file_paths, table_ref, job_config) -> int:
+        """Upload files to the staging bucket and load them with a single job."""
+        prefix = self._upload_to_gcs(file_paths)
+        try:
+            # BigQuery reads separate files in parallel, so one wildcard job
+            # loads every part at once
+            job = self.client.load_table_from_uri(
+                f"gs://{self.gcs_bucket}/{prefix}*",
+                table_ref,
+                job_config=job_config,
+            )
+            job.result()
+        finally:
+            self._delete_from_gcs(prefix)
+        return job.output_rows
+
+    def _load_via_job(
         self,
-        file_path,
+        file_paths,
         table_ref,
         write_disposition,
         limit=None,
-        time_partitioning=None,
-    ):
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=write_disposition,
-            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-            autodetect=True,
-        )
-        if time_partitioning:
-            job_config.time_partitioning = time_partitioning
+        partition_field=None,
+        clustering_fields=None,
+        schema=None,
+    ) -> int:
+        """
+        Load processed NDJSON part files into a table with load jobs.
 
-        print(f"Loading {file_path} to {table_ref}...")
+        Parts are kept as separate gzip files: BigQuery cannot split one gzip file
+        between readers and caps each at 4 GB compressed.
+
+        Returns:
+            Number of rows written.
+        """
+        job_config = _make_job_config(
+            write_disposition, partition_field, clustering_fields, schema
+        )
+        print(f"Loading {len(file_paths)} files to {table_ref}...")
 
         if limit is not None:
-            buf = io.BytesIO()
-            with open(file_path, "rb") as raw:
-                for _ in range(limit):
-                    line = raw.readline()
-                    if not line:
-                        break
-                    buf.write(line)
-            buf.seek(0)
-            total = buf.getbuffer().nbytes
-            with tqdm.wrapattr(
-                buf, "read", total=total, unit="B", unit_scale=True
-            ) as f:
-                job = self.client.load_table_from_file(
-                    f, table_ref, job_config=job_config
-                )
-        else:
-            with tqdm.wrapattr(
-                open(file_path, "rb"),
-                "read",
-                total=os.path.getsize(file_path),
-                unit="B",
-                unit_scale=True,
-            ) as f:
+            # Recompress the truncated head so it goes over the wire gzipped too;
+            # buffered so every read() is filled until the stream ends
+            lines = itertools.islice(
+                itertools.chain.from_iterable(iter_delta_lines(fp) for fp in file_paths),
+                limit,
+            )
+            head = io.BufferedReader(GzipReader(IterReader(lines)))
+            with self._progress(head) as f:
                 job = self.client.load_table_from_file(
                     f, table_ref, job_config=job_config
                 )
+            job.result()
+            return job.output_rows
+        if self.gcs_bucket:
+            return self._load_via_gcs(file_paths, table_ref, job_config)
 
+        if len(file_paths) == 1:
+            return self._load_file(file_paths[0], table_ref, job_config)
+        return self._load_parts(
+            file_paths,
+            table_ref,
+            write_disposition,
+            partition_field,
+            clustering_fields,
+            schema,
+        )
+
+    def _load_parts(
+        self,
+        file_paths,
+        table_ref,
+        write_disposition,
+        partition_field=None,
+        clustering_fields=None,
+        schema=None,
+    ) -> int:
+        """
+        Load part files with one job each into a scratch table, then copy it to `table_ref`.
+
+        Without a bucket each part needs its own job. Collecting them in a scratch
+        table first keeps the write to `table_ref` a single copy job, so a failed
+        part leaves it untouched and a retry cannot duplicate rows.
+
+        Returns:
+            Number of rows written.
+        """
+        scratch_ref = f"{table_ref}_load"
+        if write_disposition == bigquery.WriteDisposition.WRITE_APPEND:
+            # Appending copies need the destination's schema, partitioning and
+            # clustering; parts with columns it lacks fail rather than the copy
+            try:
+                existing = self.client.get_table(table_ref)
+            except NotFound:
+                existing = None
+            if existing is not None:
+                partitioning = existing.time_partitioning
+                partition_field = partitioning.field if partitioning else None
+                clustering_fields = tuple(existing.clustering_fields or ()) or None
+                schema = tuple(existing.schema)
+
+        first, *rest = file_paths
+        try:
+            rows = self._load_file(
+                first,
+                scratch_ref,
+                _make_job_config(
+                    bigquery.WriteDisposition.WRITE_TRUNCATE,
+                    partition_field,
+                    clustering_fields,
+                    schema,
+                ),
+            )
+            # Pin the first part's columns so the others cannot infer other types
+            if schema is None:
+                schema = tuple(self.client.get_table(scratch_ref).schema)
+            append_config = _make_job_config(
+                bigquery.WriteDisposition.WRITE_APPEND,
+                partition_field,
+                clustering_fields,
+                schema,
+            )
+            with (
+                ThreadPoolExecutor(max_workers=LOAD_JOB_WORKERS) as pool,
+                tqdm(
+                    total=len(file_paths), initial=1, unit="part", disable=self.quiet
+                ) as pbar,
+            ):
+                # One bar for the batch; per-file bars would overwrite each other
+                futures = [
+                    pool.submit(
+                        self._load_file, fp, scratch_ref, append_config, quiet=True
+                    )
+                    for fp in rest
+                ]
+                for future in as_completed(futures):
+                    rows += future.result()
+                    pbar.update()
+            job = self.client.copy_table(
+                scratch_ref,
+                table_ref,
+                job_config=bigquery.CopyJobConfig(write_disposition=write_disposition),
+            )
+            job.result()
+        finally:
+            self.client.delete_table(scratch_ref, not_found_ok=True)
+        return rows
+
+    def _get_schema(self, table_ref):
+        """Return the table's schema, or None if the table does not exist yet."""
+        if table_ref not in self._schemas:
+            try:
+                self._schemas[table_ref] = self.client.get_table(table_ref).schema
+            except NotFound:
+                return None
+        return self._schemas[table_ref]
+
+    def _ensure_clustering(self, table_ref, clustering_fields):
+        """Cluster an existing table on `clustering_fields` if it is not already."""
+        if table_ref in self._clustered:
+            return
+        try:
+            table = self.client.get_table(table_ref)
+        except NotFound:
+            return  # the creating load job clusters it
+        if table.clustering_fields != list(clustering_fields):
+            # Applies to data written from now on, which for staging is everything
+            table.clustering_fields = list(clustering_fields)
+            self.client.update_table(table, ["clustering_fields"])
+            print(f"Clustered {table_ref} on {', '.join(clustering_fields)}.")
+        self._clustered.add(table_ref)
+
+    def _staging_schema(self):
+        """Schema for a new staging table: the main table's columns minus derived ones."""
+        main_schema = self._get_schema(self.main_table_ref)
+        if main_schema is None:
+            return None
+        return tuple(f for f in main_schema if f.name not in DERIVED_COLUMNS)
+
+    def _load_to_table(
+        self,
+        file_paths,
+        table_ref,
+        write_disposition,
+        limit=None,
+        partition_field=None,
+        clustering_fields=None,
+        schema=None,
+    ) -> int:
+        """
+        Load processed NDJSON part files (or a single file) into a table.
+
+        The job uses `schema` when given and autodetects otherwise;
+        clustering_fields only applies when the job creates the table.
+
+        Returns:
+            Number of rows written.
+        """
+        if isinstance(file_paths, (str, os.PathLike)):
+            file_paths = [file_paths]
+        file_paths = list(file_paths)
+        if not file_paths:
+            raise ValueError(f"No files to load into {table_ref}")
+        return self._load_via_job(
+            file_paths,
+            table_ref,
+            write_disposition,
+            limit,
+            partition_field,
+            clustering_fields,
+            schema,
+        )
+
+    def _load_lines_to_table(
+        self,
+        lines,
+        table_ref,
+        write_disposition,
+        clustering_fields=None,
+        schema=None,
+        label="stream",
+        drop_unknown=False,
+    ) -> int:
+        """
+        Load NDJSON lines into a table without writing them to a file first.
+
+        The lines are gzipped on the fly into a load job rather than going
+        through the staging bucket. `drop_unknown` is passed to `_make_job_config`.
+
+        Returns:
+            Number of rows written.
+        """
+        job_config = _make_job_config(
+            write_disposition,
+            clustering_fields=clustering_fields,
+            schema=schema,
+            drop_unknown=drop_unknown,
+        )
+        print(f"Loading {label} to {table_ref}...")
+        stream = io.BufferedReader(GzipReader(IterReader(lines)))
+        with self._progress(stream) as f:
+            job = self.client.load_table_from_file(f, table_ref, job_config=job_config)
         job.result()
-        return job
+        return job.output_rows
 
-    def fetch_and_load(self, file_path, limit=None):
-        job = self._load_to_table(
-            file_path,
+    def fetch_and_load(self, file_paths, limit=None):
+        rows = self._load_to_table(
+            file_paths,
             self.main_table_ref,
             bigquery.WriteDisposition.WRITE_APPEND,
             limit,
         )
-        print(f"Loaded {job.output_rows} rows successfully.")
+        # Autodetect may have changed main's schema
+        self._schemas.pop(self.main_table_ref, None)
+        print(f"Loaded {rows} rows successfully.")
 
-    def merge_delta(self, file_path, limit=None, no_merge=True, append_staging=False):
-        # 1 — Load delta into staging table (truncate each run)
-        job = self._load_to_table(
-            file_path,
+    def dedup_deltas(self, file_paths) -> list[tuple[Path, set[int]]]:
+        """
+        Find the delta records to stage so each registration is staged only once.
+
+        Files must be in chronological order; the last record per registration wins.
+        Feed each result to `iter_delta_lines` to read the records a file still owns.
+        Fields that staging has no column for are reported, since the load drops
+        them. Nested fields are collected from the first record of each shape
+        (top-level and motTests keys), so fields deeper than a test that only
+        appear in records of an already-seen shape go unreported.
+
+        Returns:
+            (path, line numbers to keep) for each file that still owns records,
+            in input order.
+        """
+        latest = {}
+        keys = set()  # every field path seen, nested motTests fields included
+        shapes = set()  # _record_shape of every record walked for keys
+        total = 0
+        for i, fp in enumerate(file_paths):
+            # Numbered exactly as iter_delta_lines numbers them
+            for n, line in _numbered_lines(fp):
+                if not line.strip():
+                    continue
+                total += 1
+                record = orjson.loads(line)
+                # Most records share a handful of shapes; walk each shape once
+                shape = _record_shape(record)
+                if shape not in shapes:
+                    shapes.add(shape)
+                    _collect_keys(record, keys)
+                registration = record.get("registration")
+                latest[(i, n) if registration is None else registration] = (i, n)
+        keep = [set() for _ in file_paths]
+        for i, n in latest.values():
+            keep[i].add(n)
+        print(f"Deduplicated {total} delta records to {len(latest)}.")
+        self._report_unknown_fields(keys)
+        return [(Path(fp), lines) for fp, lines in zip(file_paths, keep) if lines]
+
+    def _report_unknown_fields(self, keys):
+        """Warn about field paths in `keys` that the pinned staging schema will drop."""
+        schema = self._staging_schema()
+        if schema is None:
+            return  # autodetected staging keeps every field
+        unknown = keys - _field_paths(schema)
+        # Name only the outermost unknown field, not everything nested below it
+        unknown = sorted(p for p in unknown if p.rpartition(".")[0] not in unknown)
+        if unknown:
+            print(
+                f"Warning: dropping fields with no staging column: {', '.join(unknown)}"
+            )
+
+    def merge_delta_from_iter(self, lines, append_staging=False, label="delta"):
+        """
+        Load NDJSON delta lines into the staging table.
+
+        Fields staging has no column for are dropped without a warning; only
+        `dedup_deltas` reports them.
+
+        Returns:
+            Number of rows staged.
+        """
+        write_disposition = (
+            bigquery.WriteDisposition.WRITE_TRUNCATE
+            if not append_staging
+            else bigquery.WriteDisposition.WRITE_APPEND
+        )
+        # Clustered on the MERGE key so the join prunes blocks; tables created
+        # before clustering was introduced are converted on the first load
+        clustering_fields = ("registration",)
+        if not append_staging:
+            self._ensure_clustering(self.staging_table_ref, clustering_fields)
+        # Fields staging lacks are upstream additions rather than bad data, so
+        # they are dropped (and reported by dedup_deltas) instead of failing the batch
+        rows = self._load_lines_to_table(
+            lines,
             self.staging_table_ref,
-            bigquery.WriteDisposition.WRITE_TRUNCATE if not append_staging else bigquery.WriteDisposition.WRITE_APPEND,
-            limit,
+            write_disposition,
+            clustering_fields=clustering_fields,
+            schema=self._staging_schema(),
+            label=label,
+            drop_unknown=True,
         )
-        print(f"Staged {job.output_rows} rows.")
+        print(f"Staged {rows} rows.")
+        return rows
+
+    def stage_delta(self, file_path, keep=None, append_staging=False, limit=None) -> int:
+        """
+        Load one processed delta file into the staging table.
+
+        `keep` restricts it to the line numbers `dedup_deltas` assigned to the file.
+        With `append_staging=True` the file is added to what is already staged.
+        Dropped fields are only reported by `dedup_deltas`, not here.
+
+        Returns:
+            Number of rows staged.
+        """
+        lines = iter_delta_lines(file_path, keep)
+        if limit is not None:
+            lines = itertools.islice(lines, limit)
+        return self.merge_delta_from_iter(lines, append_staging, label=file_path)
+
+    def merge_delta(
+        self, file_path, limit=None, no_merge=True, append_staging=False, dedup=True
+    ):
+        """
+        Stage one delta file, then MERGE it unless `no_merge`.
+
+        With `dedup=False` the file is staged as is, and fields staging drops
+        are not reported.
+        """
+        # 0 — Collapse repeated registrations within the file
+        keep = None
+        if dedup:
+            deduped = self.dedup_deltas([file_path])
+            if not deduped:
+                print(f"No records in {file_path}.")
+                return
+            _, keep = deduped[0]
+
+        # 1 — Load delta into staging table (truncate each run)
+        self.stage_delta(file_path, keep, append_staging, limit)
 
         if no_merge:
             return
 
-        # 2 - Merge
+        self.merge_delta_final()
+
+    def apply_merge(self) -> bigquery.QueryJob:
+        """
+        Start applying everything staged so far to the main table.
+
+        Small batches are MERGEd row by row. Once staging holds more than
+        `rebuild_ratio` of main's row count, main is rewritten in one pass instead.
+        Staging is kept; the next batch's first load truncates it.
+
+        Returns:
+            The running query job; call result() to wait for it.
+        """
+        if self._should_rebuild():
+            return self._rebuild_main()
         print("Running MERGE...")
-        merge_job = self.client.query(self.merge_template)
-        merge_job.result()
-        stats = merge_job.num_dml_affected_rows
-        print(f"MERGE complete — {stats} rows affected.")
-
-        # 3 — Drop staging table
-        self.client.delete_table(self.staging_table_ref, not_found_ok=True)
-        print(f"Dropped staging table {self.staging_table_ref}.")
-
-    def create_table(self, file_path, limit=None):
-        """Create the main table from a bulk file with daily partitioning on lastMotTestDate."""
-        partitioning = bigquery.TimePartitioning(
-            type_=bigquery.TimePartitioningType.DAY,
-            field="lastMotTestDate",
-        )
-        job = self._load_to_table(
-            file_path,
+        return self.client.query(self.merge_template)
+
+    def merge_delta_final(self):
+        """Apply everything staged so far to the main table and wait for it."""
+        # 2 - Merge (or rebuild)
+        job = self.apply_merge()
+        job.result()
+        if job.num_dml_affected_rows is not None:
+            print(f"MERGE complete — {job.num_dml_affected_rows} rows affected.")
+        else:
+            print(f"Rebuilt {self.main_table_ref}.")
+
+    def stage_deltas(self, deduped) -> int:
+        """
+        Replace the staging table's contents with a whole deduplicated batch.
+
+        All files go up as one gzip stream into a single load job, so the batch
+        pays for load job scheduling once.
+
+        Args:
+            deduped: (path, line numbers to keep) pairs from `dedup_deltas`.
+
+        Returns:
+            Number of rows staged.
+        """
+        lines = itertools.chain.from_iterable(
+            iter_delta_lines(fp, keep) for fp, keep in deduped
+        )
+        return self.merge_delta_from_iter(lines, label=f"{len(deduped)} delta files")
+
+    def _should_rebuild(self) -> bool:
+        counts = next(
+            iter(
+                self.client.query(
+                    f"SELECT (SELECT COUNT(*) FROM `{self.staging_table_ref}`) AS delta_rows, "
+                    f"(SELECT COUNT(*) FROM `{self.main_table_ref}`) AS main_rows"
+                ).result()
+            )
+        )
+        print(f"{counts.delta_rows} staged rows against {counts.main_rows} in main.")
+        return counts.delta_rows > self.rebuild_ratio * counts.main_rows
+
+    def _rebuild_main(self) -> bigquery.QueryJob:
+        """Start rewriting the main table as its untouched rows plus the staged batch."""
+        # A truncating query must repeat the table's own partitioning and clustering
+        main = self.client.get_table(self.main_table_ref)
+        columns = ", ".join(
+            f"{'delta' if f.name in MERGED_COLUMNS else 'main'}.`{f.name}`"
+            for f in main.schema
+        )
+        job_config = bigquery.QueryJobConfig(
+            destination=self.main_table_ref,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            time_partitioning=main.time_partitioning,
+            clustering_fields=main.clustering_fields,
+        )
+        print(f"Rebuilding {self.main_table_ref}...")
+        self._schemas.pop(self.main_table_ref, None)
+        return self.client.query(
+            self.rebuild_template.replace("!!columns!!", columns), job_config=job_config
+        )
+
+    def create_table(self, file_paths, limit=None):
+        """Create the main table from bulk part files with daily partitioning on lastMotTestDate, clustered on registration."""
+        rows = self._load_to_table(
+            file_paths,
             self.main_table_ref,
             bigquery.WriteDisposition.WRITE_TRUNCATE,
             limit,
-            time_partitioning=partitioning,
+            partition_field=PARTITION_FIELD,
+            clustering_fields=("registration",),
         )
+        self._schemas.pop(self.main_table_ref, None)
         print(
-            f"Created {self.main_table_ref} with {job.output_rows} rows (partitioned daily on lastMotTestDate)."
+            f"Created {self.main_table_ref} with {rows} rows (partitioned daily on lastMotTestDate, clustered on registration)."
         )
 
 
@@ -147,5 +791,9 @@ if __name__ == "__main__":
     table_id = "motwot_main"
 
     uploader = GCPUploader(dataset_id=dataset_id, main_table_id=table_id)
-    uploader.create_table("data/bulk-light-vehicle_02-02-2026.json", limit=10000)
-    # uploader.fetch_and_load("data/delta-light-vehicle_06-02-2026.json", limit=3000)
+    uploader.create_table(
+        sorted(Path("data").glob("bulk-light-vehicle_02-02-2026.*.json.gz")), limit=10000
+    )
+    # uploader.fetch_and_load(
+    #     sorted(Path("data").glob("delta-light-vehicle_06-02-2026.*.json.gz")), limit=3000
+    # )
@@ -0,0 +1,38 @@
+-- Full rewrite of the main table, used instead of merge_delta.sql for large batches.
+-- Run as a WRITE_TRUNCATE query into main. !!columns!! is main's column list in
+-- order, taken from delta for the columns merge_delta.sql writes and from main otherwise.
+WITH delta AS (
+    SELECT
+        *,
+        motTests[SAFE_OFFSET(ARRAY_LENGTH(motTests) - 1)].completedDate AS last_test_date,
+        COALESCE(motTests[SAFE_OFFSET(ARRAY_LENGTH(motTests) - 1)].testResult, 'NEVER MOT') AS last_test_result,
+        CAST(motTests[SAFE_OFFSET(ARRAY_LENGTH(motTests) - 1)].odometerValue AS INT64) AS mileage,
+        DATE_DIFF(CURRENT_DATE(), DATE(firstUsedDate), YEAR) AS vehicle_age,
+        (SELECT COUNT(*) FROM UNNEST(motTests) AS t WHERE t.testResult = 'PASSED') AS pass_count,
+        (SELECT COUNT(*) FROM UNNEST(motTests) AS t WHERE t.testResult = 'FAILED') AS fail_count
+    FROM `!!staging!!`
+    WHERE modification IN ('CREATED', 'UPDATED', 'DELETED')
+
+    -- Dedupe reg, as the MERGE does
+    QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY registration 
+        ORDER BY lastMotTestDate DESC
+    ) = 1
+)
+
+-- Keep untouched rows
+SELECT main.*
+FROM `!!main!!` AS main
+WHERE NOT EXISTS (
+    SELECT 1 FROM delta WHERE delta.registration = main.registration
+)
+
+UNION ALL
+
+-- Updated rows keep main's values for columns the MERGE does not set; new rows
+-- get NULL there, as with the MERGE's INSERT. Deletions are not carried over
+SELECT !!columns!!
+FROM delta
+LEFT JOIN `!!main!!` AS main
+    ON main.registration = delta.registration
+WHERE delta.modification IN ('CREATED', 'UPDATED');
@@ -1,4 +1,6 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from fastapi import FastAPI, BackgroundTasks
 from data_runner.data_puller import DataPuller
@@ -12,22 +14,40 @@ TABLE_ID = "motwot_main_enriched"
 app = FastAPI()
 
 
+def delta_date(fp: Path) -> datetime:
+    """Date a processed delta part covers, for ordering a batch chronologically."""
+    name = fp.name.split(".", 1)[0]  # drop the part index and extension
+    return datetime.strptime(DataProcessor.extract_date_from_folder(name), "%d-%m-%Y")
+
+
 def perform_weekly_delta_merge():
-    # 1 - Pull data
+    # 1 & 2 - Pull data, processing each file while the rest download
     puller = DataPuller()
-    puller.download_deltas()
-
-    # 2 - Process data
     processor = DataProcessor(data_dir=Path(DATA_DIR))
-    filepaths = processor.run()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        futures = []
+        puller.download_deltas(
+            on_download=lambda zf: futures.append(
+                pool.submit(processor.process_download, zf)
+            )
+        )
+        filepaths = [fp for f in futures for fp in f.result()]
 
     # 3 - Upload data
-    uploader = GCPUploader(dataset_id=DATASET_ID, main_table_id=TABLE_ID)
-    for i, fp in enumerate(filepaths):
-        if i == 0:
-            uploader.merge_delta(fp, no_merge=True, append_staging=False)
-        else:
-            uploader.merge_delta(fp, no_merge=True, append_staging=True)
+    if not filepaths:
+        return
+    uploader = GCPUploader(dataset_id=DATASET_ID, main_table_id=TABLE_ID, quiet=True)
+
+    # Keep only each registration's latest record across the whole batch; the sort
+    # is stable, so each delta's parts stay in source order
+    filepaths.sort(key=delta_date)
+    deduped = uploader.dedup_deltas(filepaths)
+
+    # Surviving records stream straight from the processed files into one load job;
+    # the MERGE into main is left to bigquery/scheduled/1_delta_merge.sql
+    if deduped:
+        uploader.stage_deltas(deduped)
+    for fp in filepaths:
         os.remove(fp)
 
 